@@ -0,0 +1,114 @@
+"""
+Agendador baseado em roda temporizadora (timer wheel)
+
+Os agendamentos são colocados em compartimentos de uma roda que gira uma vez
+por intervalo (tick). A cada giro apenas o compartimento atual é examinado,
+então disparar um agendamento não exige consultar a tabela periodicamente.
+
+Se o disparo falhar (ex.: banco bloqueado), o item volta para a roda e é
+tentado novamente com espera crescente.
+"""
+import logging
+import math
+import threading
+import time
+from datetime import datetime
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+# Espera antes de tentar novamente um disparo que falhou (segundos)
+ESPERA_MINIMA_FALHA = 1.0
+ESPERA_MAXIMA_FALHA = 60.0
+
+
+class RodaTemporizadora:
+    """
+    Roda temporizadora com compartimentos fixos e contagem de voltas
+
+    Agendamentos mais distantes que uma volta completa ficam no compartimento
+    correspondente com o número de voltas que ainda faltam.
+    """
+
+    def __init__(self, ao_disparar: Callable, intervalo: float = 1.0, compartimentos: int = 60):
+        self.ao_disparar = ao_disparar
+        self.intervalo = intervalo
+        self.compartimentos: List[list] = [[] for _ in range(compartimentos)]
+        self._cursor = 0
+        self._ultimo_giro = time.monotonic()
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+
+    def agendar(self, item, horario: datetime):
+        """
+        Agenda o item para disparar no horário informado.
+        Horários já passados disparam no próximo giro.
+        """
+        atraso = (horario - datetime.now()).total_seconds()
+        self._inserir(item, atraso, tentativas=0)
+
+    def _inserir(self, item, atraso: float, tentativas: int):
+        total = len(self.compartimentos)
+
+        with self._lock:
+            # O atraso é contado a partir do último giro, para não disparar antes da hora
+            decorrido = time.monotonic() - self._ultimo_giro
+            ticks = max(1, math.ceil((atraso + decorrido) / self.intervalo))
+            indice = (self._cursor + ticks) % total
+            voltas = (ticks - 1) // total
+            self.compartimentos[indice].append([voltas, item, tentativas])
+
+    def girar(self):
+        """
+        Avança a roda um compartimento e dispara os itens vencidos
+        """
+        with self._lock:
+            self._cursor = (self._cursor + 1) % len(self.compartimentos)
+            self._ultimo_giro = time.monotonic()
+            compartimento = self.compartimentos[self._cursor]
+
+            vencidos = [(item, tentativas) for voltas, item, tentativas in compartimento if voltas == 0]
+            pendentes = [
+                [voltas - 1, item, tentativas]
+                for voltas, item, tentativas in compartimento if voltas > 0
+            ]
+            self.compartimentos[self._cursor] = pendentes
+
+        for item, tentativas in vencidos:
+            try:
+                self.ao_disparar(item)
+            except Exception:
+                espera = min(ESPERA_MINIMA_FALHA * 2 ** tentativas, ESPERA_MAXIMA_FALHA)
+                logger.exception(
+                    "Erro ao disparar agendamento %s; nova tentativa em %.0fs", item, espera
+                )
+                self._inserir(item, espera, tentativas + 1)
+
+    def iniciar(self):
+        """
+        Inicia a thread que gira a roda em segundo plano
+        """
+        if self._thread is not None:
+            return
+        self._parar.clear()
+        self._ultimo_giro = time.monotonic()
+        self._thread = threading.Thread(target=self._executar, name="roda-temporizadora", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        """
+        Interrompe a thread da roda
+        """
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _executar(self):
+        proximo_tick = self._ultimo_giro + self.intervalo
+        while not self._parar.wait(max(0.0, proximo_tick - time.monotonic())):
+            # Se a thread atrasou, gira quantas vezes for necessário
+            while proximo_tick <= time.monotonic():
+                self.girar()
+                proximo_tick += self.intervalo
@@ -0,0 +1,301 @@
+"""
+Buffer de escrita local (write-ahead) para a entrada de clientes na fila
+
+Quando o SQLite está bloqueado (backup, reorganização longa etc.), o cliente
+é gravado em um arquivo local com fsync e a resposta é enviada na hora. Uma
+thread em segundo plano descarrega o arquivo na tabela clientes em lotes,
+na mesma ordem em que as entradas chegaram.
+
+Cada entrada tem um identificador único (id_buffer), gravado também no
+cliente criado. Se a API cair depois de gravar o lote no banco e antes de
+limpar o arquivo, as entradas repetidas são ignoradas na próxima descarga.
+
+Cada processo da API grava no próprio arquivo (fila_pendente.<pid>.wal),
+travado com flock enquanto o processo está vivo. Ao iniciar, o processo
+assume os arquivos sem trava deixados por processos que caíram. Em sistemas
+sem fcntl (Windows) não há trava: use um único processo.
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Callable, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Diretório onde os arquivos de entradas pendentes são gravados
+DIRETORIO_BUFFER = os.getenv("FILA_DIRETORIO_BUFFER", ".")
+
+# Nome dos arquivos de buffer: fila_pendente.<identificador do processo>.wal
+PREFIXO_ARQUIVO = "fila_pendente"
+
+# Com FILA_MODO_BUFFER=1 toda entrada passa pelo buffer, mesmo com o banco livre
+MODO_BUFFER = os.getenv("FILA_MODO_BUFFER", "0") == "1"
+
+# Máximo de entradas pendentes antes de recusar novos clientes
+LIMITE_BUFFER = 1000
+
+# Máximo de entradas gravadas no banco por lote
+TAMANHO_LOTE = 50
+
+# Espera entre tentativas quando o banco continua indisponível (segundos)
+ESPERA_MINIMA = 0.5
+ESPERA_MAXIMA = 10.0
+
+
+class BufferCheioError(Exception):
+    """
+    O buffer atingiu o limite de entradas pendentes
+    """
+
+
+class BufferEscrita:
+    """
+    Fila de entradas pendentes persistida em arquivo (uma entrada JSON por linha)
+    """
+
+    def __init__(self, gravar_lote: Callable, diretorio: str = DIRETORIO_BUFFER,
+                 identificador: Optional[str] = None,
+                 limite: int = LIMITE_BUFFER, tamanho_lote: int = TAMANHO_LOTE):
+        self.gravar_lote = gravar_lote
+        self.diretorio = diretorio
+        self.identificador = identificador
+        self.limite = limite
+        self.tamanho_lote = tamanho_lote
+        self._pendentes: List[dict] = []
+        self._lock = threading.Lock()
+        # Uma descarga por vez: a thread e as requisições podem descarregar ao mesmo tempo
+        self._lock_descarga = threading.Lock()
+        self._arquivo = None
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+
+    @property
+    def caminho(self) -> str:
+        """
+        Arquivo deste processo; o PID é lido na hora, pois workers podem ser
+        criados por fork depois que o módulo foi importado
+        """
+        identificador = self.identificador or str(os.getpid())
+        return os.path.join(self.diretorio, f"{PREFIXO_ARQUIVO}.{identificador}.wal")
+
+    @property
+    def ativo(self) -> bool:
+        """
+        Indica se há entradas aguardando gravação no banco
+        """
+        return len(self._pendentes) > 0
+
+    def pendentes(self) -> List[dict]:
+        """
+        Retorna uma cópia das entradas pendentes, na ordem de chegada
+        """
+        with self._lock:
+            return list(self._pendentes)
+
+    def registrar(self, nome: str, tipo_atendimento: str, senha: str = None) -> dict:
+        """
+        Grava a entrada no arquivo com fsync e a agenda para descarga no banco.
+        Lança BufferCheioError se o limite de pendentes foi atingido.
+        """
+        with self._lock:
+            if len(self._pendentes) >= self.limite:
+                raise BufferCheioError(f"Buffer com {len(self._pendentes)} entradas pendentes")
+
+            entrada = {
+                "id_buffer": uuid.uuid4().hex,
+                "nome": nome,
+                "tipo_atendimento": tipo_atendimento,
+                "senha": senha,
+                "data_chegada": datetime.now().isoformat()
+            }
+
+            arquivo = self._abrir_arquivo()
+            arquivo.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+
+            self._pendentes.append(entrada)
+
+        self._acordar.set()
+        return entrada
+
+    def descarregar(self) -> int:
+        """
+        Grava no banco o próximo lote de entradas pendentes.
+        Retorna a quantidade de entradas retiradas do buffer.
+        """
+        with self._lock_descarga:
+            with self._lock:
+                lote = self._pendentes[:self.tamanho_lote]
+            if not lote:
+                return 0
+
+            # Gravação no banco fora do lock: novas entradas continuam sendo aceitas
+            self.gravar_lote(lote)
+
+            with self._lock:
+                del self._pendentes[:len(lote)]
+                self._reescrever_arquivo()
+
+            return len(lote)
+
+    def descarregar_tudo(self):
+        """
+        Grava no banco todas as entradas pendentes, lote a lote.
+        Repassa o erro se o banco continuar indisponível.
+        """
+        while self.descarregar():
+            pass
+
+    def iniciar(self):
+        """
+        Recarrega as entradas do próprio arquivo e dos arquivos abandonados
+        por processos que caíram, e inicia a thread de descarga
+        """
+        if self._thread is not None:
+            return
+        with self._lock:
+            self._recuperar_pendentes()
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._executar, name="buffer-escrita", daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        """
+        Interrompe a thread de descarga; entradas pendentes continuam no arquivo
+        """
+        self._parar.set()
+        self._acordar.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if self._arquivo is not None:
+                # Arquivo vazio é removido ainda travado, para não acumular arquivos por PID
+                if not self._pendentes:
+                    os.remove(self.caminho)
+                self._arquivo.close()
+                self._arquivo = None
+
+    def _executar(self):
+        espera = ESPERA_MINIMA
+        while not self._parar.is_set():
+            if not self.ativo:
+                self._acordar.wait()
+                self._acordar.clear()
+                continue
+
+            try:
+                self.descarregar()
+                espera = ESPERA_MINIMA
+            except Exception:
+                logger.exception("Erro ao descarregar buffer de escrita; nova tentativa em %.1fs", espera)
+                self._parar.wait(espera)
+                espera = min(espera * 2, ESPERA_MAXIMA)
+
+    def _abrir_arquivo(self):
+        if self._arquivo is None:
+            arquivo = open(self.caminho, "a", encoding="utf-8")
+            if not _travar(arquivo, self.caminho):
+                arquivo.close()
+                raise RuntimeError(f"Arquivo de buffer {self.caminho} em uso por outro processo")
+            self._arquivo = arquivo
+        return self._arquivo
+
+    def _recuperar_pendentes(self):
+        """
+        Junta no próprio arquivo as entradas dele e as dos arquivos sem trava
+        (chamado com o lock)
+        """
+        self._abrir_arquivo()
+        entradas = _ler_entradas(self.caminho)
+
+        assumidos = []
+        padrao = os.path.join(self.diretorio, f"{PREFIXO_ARQUIVO}.*.wal")
+        for caminho in sorted(glob.glob(padrao)):
+            if os.path.abspath(caminho) == os.path.abspath(self.caminho):
+                continue
+            arquivo = open(caminho, "a", encoding="utf-8")
+            if not _travar(arquivo, caminho):
+                # Arquivo de um processo vivo
+                arquivo.close()
+                continue
+            entradas.extend(_ler_entradas(caminho))
+            assumidos.append((caminho, arquivo))
+
+        # Entradas repetidas podem existir se uma recuperação anterior foi interrompida
+        vistos = set()
+        self._pendentes = []
+        for entrada in sorted(entradas, key=lambda e: e["data_chegada"]):
+            if entrada["id_buffer"] not in vistos:
+                vistos.add(entrada["id_buffer"])
+                self._pendentes.append(entrada)
+
+        if assumidos:
+            logger.info("Recuperadas entradas de %d arquivo(s) de buffer abandonado(s)", len(assumidos))
+        self._reescrever_arquivo()
+
+        # Só apaga os arquivos assumidos depois que as entradas estão no próprio arquivo
+        for caminho, arquivo in assumidos:
+            os.remove(caminho)
+            arquivo.close()
+
+    def _reescrever_arquivo(self):
+        """
+        Substitui o arquivo pelas entradas ainda pendentes (chamado com o lock)
+        """
+        temporario = self.caminho + ".tmp"
+        arquivo = open(temporario, "w", encoding="utf-8")
+        # O novo arquivo já entra no lugar do antigo travado
+        _travar(arquivo, temporario)
+        for entrada in self._pendentes:
+            arquivo.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+        arquivo.flush()
+        os.fsync(arquivo.fileno())
+        os.replace(temporario, self.caminho)
+
+        if self._arquivo is not None:
+            self._arquivo.close()
+        self._arquivo = arquivo
+
+
+def _travar(arquivo, caminho: str) -> bool:
+    """
+    Tenta travar o arquivo sem esperar. Retorna False se outro processo o travou
+    ou se o caminho já aponta para outro arquivo (substituído pelo dono).
+    """
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    try:
+        return os.fstat(arquivo.fileno()).st_ino == os.stat(caminho).st_ino
+    except FileNotFoundError:
+        return False
+
+
+def _ler_entradas(caminho: str) -> List[dict]:
+    if not os.path.exists(caminho):
+        return []
+
+    entradas = []
+    with open(caminho, encoding="utf-8") as arquivo:
+        for linha in arquivo:
+            try:
+                entradas.append(json.loads(linha))
+            except ValueError:
+                # Linha incompleta de uma gravação interrompida: nunca foi confirmada
+                continue
+    return entradas
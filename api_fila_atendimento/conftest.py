@@ -0,0 +1,105 @@
+"""
+Configuração dos testes automatizados (pytest)
+
+Os testes usam um diretório temporário para o banco SQLite e para os arquivos
+do buffer de escrita, definido antes de importar a API. Assim, nenhum arquivo
+do ambiente de desenvolvimento é lido ou alterado.
+"""
+import glob
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+
+DIRETORIO_TESTES = tempfile.mkdtemp()
+
+os.environ["FILA_DATABASE_URL"] = f"sqlite:///{os.path.join(DIRETORIO_TESTES, 'fila_teste.db')}"
+os.environ["FILA_DIRETORIO_BUFFER"] = DIRETORIO_TESTES
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from consultas import contar_consultas  # noqa: E402
+
+# test_api.py é um script manual que precisa da API rodando em localhost
+collect_ignore = ["test_api.py"]
+
+
+@pytest.fixture
+def cliente_api(monkeypatch):
+    """
+    Cliente HTTP da API com a fila, os agendamentos e o buffer de escrita vazios.
+    O modo buffer começa desligado, mesmo com FILA_MODO_BUFFER=1 no ambiente.
+    """
+    import main
+    from database import SessionLocal
+    from models import Cliente, Agendamento
+
+    monkeypatch.setattr(main, "MODO_BUFFER", False)
+    assert main.buffer_escrita.diretorio == DIRETORIO_TESTES
+    for caminho in glob.glob(os.path.join(DIRETORIO_TESTES, "fila_pendente.*")):
+        os.remove(caminho)
+
+    db = SessionLocal()
+    try:
+        db.query(Cliente).delete()
+        db.query(Agendamento).delete()
+        db.commit()
+    finally:
+        db.close()
+
+    with TestClient(main.app) as cliente:
+        yield cliente
+
+
+@pytest.fixture
+def limite_consultas():
+    """
+    Falha o teste se o bloco executar mais consultas ao banco que o limite.
+
+    Uso:
+        with limite_consultas(5):
+            cliente_api.post("/fila", json=...)
+    """
+    @contextmanager
+    def verificar(maximo: int):
+        with contar_consultas(todas_as_threads=True) as contador:
+            yield contador
+
+        if contador.total > maximo:
+            repetidas = "\n".join(f"  {n}x {sql}" for sql, n in contador.repetidas())
+            pytest.fail(
+                f"{contador.total} consultas ao banco (limite: {maximo})"
+                + (f"\nInstruções repetidas (possível N+1):\n{repetidas}" if repetidas else "")
+            )
+
+    return verificar
+
+
+@pytest.fixture
+def travar_banco():
+    """
+    Trava o banco a partir de outra conexão, como um backup em andamento.
+    A trava é liberada ao final do teste, ou antes com conexao.rollback().
+
+    Uso:
+        travar_banco()             # bloqueia escritas; leituras continuam
+        travar_banco("EXCLUSIVE")  # bloqueia também as leituras
+    """
+    from database import engine
+
+    conexoes = []
+
+    def travar(modo: str = "IMMEDIATE"):
+        conexao = sqlite3.connect(engine.url.database, isolation_level=None)
+        conexao.execute(f"BEGIN {modo}")
+        conexoes.append(conexao)
+        return conexao
+
+    yield travar
+
+    for conexao in conexoes:
+        if conexao.in_transaction:
+            conexao.rollback()
+        conexao.close()
@@ -0,0 +1,118 @@
+"""
+Contagem de consultas ao banco de dados
+
+Registra eventos no engine do SQLAlchemy para contar as instruções SQL e o
+tempo gasto no banco. A contagem é feita por requisição (usada no cabeçalho
+de depuração) ou para todo o processo (usada nos testes de orçamento de
+consultas).
+"""
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class ContadorConsultas:
+    """
+    Acumula a quantidade de instruções SQL, o tempo gasto e o texto de cada uma
+
+    Um executemany conta uma instrução por conjunto de parâmetros: um UPDATE
+    em lote para n linhas custa n, como os n UPDATEs que ele substitui.
+    Instruções que falharam também são contadas.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.tempo = 0.0  # segundos
+        self.instrucoes: List[str] = []
+        self._lock = threading.Lock()
+
+    def registrar(self, instrucao: str, duracao: float, quantidade: int = 1):
+        with self._lock:
+            self.total += quantidade
+            self.tempo += duracao
+            self.instrucoes.extend([instrucao] * quantidade)
+
+    def repetidas(self) -> List[Tuple[str, int]]:
+        """
+        Instruções executadas mais de uma vez, da mais para a menos frequente.
+        Indicam consultas feitas em laço (N+1).
+        """
+        return [(sql, n) for sql, n in Counter(self.instrucoes).most_common() if n > 1]
+
+
+# Contador da requisição atual (um por requisição, isolado entre threads e tarefas)
+_contador_requisicao: ContextVar = ContextVar("contador_requisicao", default=None)
+
+# Contadores que recebem todas as consultas do processo
+_contadores_globais: List[ContadorConsultas] = []
+
+
+def instrumentar(engine: Engine):
+    """
+    Registra no engine os eventos que alimentam os contadores
+    """
+    if event.contains(engine, "before_cursor_execute", _antes_de_executar):
+        return
+    event.listen(engine, "before_cursor_execute", _antes_de_executar)
+    event.listen(engine, "after_cursor_execute", _depois_de_executar)
+    event.listen(engine, "handle_error", _ao_falhar)
+
+
+@contextmanager
+def contar_consultas(todas_as_threads: bool = False):
+    """
+    Conta as consultas executadas dentro do bloco.
+
+    Por padrão conta apenas o contexto atual (a requisição em andamento).
+    Com todas_as_threads=True conta as consultas de todo o processo.
+    """
+    contador = ContadorConsultas()
+    if todas_as_threads:
+        _contadores_globais.append(contador)
+        try:
+            yield contador
+        finally:
+            _contadores_globais.remove(contador)
+    else:
+        token = _contador_requisicao.set(contador)
+        try:
+            yield contador
+        finally:
+            _contador_requisicao.reset(token)
+
+
+def _antes_de_executar(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("inicio_consultas", []).append(time.perf_counter())
+
+
+def _depois_de_executar(conn, cursor, statement, parameters, context, executemany):
+    duracao = time.perf_counter() - conn.info["inicio_consultas"].pop()
+    _registrar(statement, duracao, len(parameters) if executemany and parameters else 1)
+
+
+def _ao_falhar(contexto):
+    # Instruções que falharam (ex.: banco bloqueado) não chegam a after_cursor_execute
+    conn = contexto.connection
+    inicios = conn.info.get("inicio_consultas") if conn is not None else None
+    if not inicios or contexto.statement is None:
+        # Erro antes de a instrução ser enviada (ex.: ao conectar)
+        return
+
+    duracao = time.perf_counter() - inicios.pop()
+    parametros = contexto.parameters
+    executemany = contexto.execution_context is not None and contexto.execution_context.executemany
+    _registrar(contexto.statement, duracao, len(parametros) if executemany and parametros else 1)
+
+
+def _registrar(statement: str, duracao: float, quantidade: int):
+    contador = _contador_requisicao.get()
+    if contador is not None:
+        contador.registrar(statement, duracao, quantidade)
+    for contador in list(_contadores_globais):
+        contador.registrar(statement, duracao, quantidade)
@@ -1,14 +1,30 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+from consultas import instrumentar
 
 # Configuração do banco de dados SQLite
-SQLALCHEMY_DATABASE_URL = "sqlite:///./fila_atendimento.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("FILA_DATABASE_URL", "sqlite:///./fila_atendimento.db")
+
+# Tempo máximo de espera pelo banco bloqueado (segundos)
+TEMPO_ESPERA_PADRAO = 5.0
+
+# Na entrada de clientes a espera é curta: com o banco bloqueado, o cliente
+# segue pelo buffer de escrita (ver buffer_escrita.py)
+TEMPO_ESPERA_ENTRADA = 0.2
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": TEMPO_ESPERA_PADRAO}
 )
 
+# Contagem de consultas por requisição (ver consultas.py)
+instrumentar(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -24,3 +40,26 @@ def get_db():
     finally:
         db.close()
 
+
+def banco_bloqueado(erro: OperationalError) -> bool:
+    """
+    Indica se o erro foi causado por outro processo segurando o banco
+    (ex.: backup em andamento)
+    """
+    mensagem = str(erro.orig).lower()
+    return "locked" in mensagem or "busy" in mensagem
+
+
+def definir_espera(db: Session, segundos: float):
+    """
+    Define por quanto tempo a sessão espera pelo banco bloqueado antes de
+    lançar OperationalError. Vale até a conexão voltar ao pool.
+    """
+    db.connection().exec_driver_sql(f"PRAGMA busy_timeout = {int(segundos * 1000)}")
+
+
+@event.listens_for(engine, "checkin")
+def _restaurar_espera(dbapi_connection, connection_record):
+    # Conexão devolvida ao pool volta à espera padrão para o próximo uso
+    if dbapi_connection is not None:
+        dbapi_connection.execute(f"PRAGMA busy_timeout = {int(TEMPO_ESPERA_PADRAO * 1000)}")
@@ -1,51 +1,356 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import logging
+import os
+
+from fastapi import FastAPI, Depends, HTTPException, Request, status
+from sqlalchemy import select, update, func, and_, or_
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.exc import OperationalError
 from typing import List
 from datetime import datetime
+from contextlib import asynccontextmanager
+
+from database import (
+    engine, get_db, Base, SessionLocal, banco_bloqueado, definir_espera,
+    TEMPO_ESPERA_ENTRADA, TEMPO_ESPERA_PADRAO
+)
+from models import Cliente, Agendamento
+from schemas import (
+    ClienteCreate, ClienteResponse, MensagemResponse,
+    AgendamentoCreate, AgendamentoResponse
+)
+from senhas import gerador_senhas
+from agendador import RodaTemporizadora
+from buffer_escrita import BufferEscrita, BufferCheioError, MODO_BUFFER
+from consultas import contar_consultas
+
+logger = logging.getLogger(__name__)
 
-from database import engine, get_db, Base
-from models import Cliente
-from schemas import ClienteCreate, ClienteResponse, MensagemResponse
+# Com FILA_DEBUG_CONSULTAS=1 as respostas informam as consultas feitas ao banco
+DEBUG_CONSULTAS = os.getenv("FILA_DEBUG_CONSULTAS", "0") == "1"
 
 # Criar as tabelas no banco de dados
 Base.metadata.create_all(bind=engine)
 
+
+def incluir_agendamento_na_fila(agendamento_id: int):
+    """
+    Coloca na fila o cliente de um agendamento cujo horário chegou.
+    Chamado pela roda temporizadora em segundo plano.
+    
+    Com vários processos, todos carregam os mesmos agendamentos; o UPDATE
+    condicional garante que só um deles coloca o cliente na fila.
+    """
+    db = SessionLocal()
+    try:
+        agendamento = db.get(Agendamento, agendamento_id)
+        if not agendamento or agendamento.enviado:
+            return
+
+        # Senha gerada antes de reivindicar: a reserva de bloco usa outra conexão
+        senha = gerador_senhas.proxima_senha(agendamento.tipo_atendimento)
+
+        reivindicado = db.query(Agendamento).filter(
+            Agendamento.id == agendamento_id,
+            Agendamento.enviado == False
+        ).update({Agendamento.enviado: True}, synchronize_session=False)
+        if reivindicado == 0:
+            # Outro processo já colocou o cliente na fila
+            db.rollback()
+            return
+
+        cliente = Cliente(
+            nome=agendamento.nome,
+            tipo_atendimento=agendamento.tipo_atendimento,
+            senha=senha,
+            data_chegada=datetime.now(),
+            atendido=False,
+            posicao=0  # Será atualizado pela função reorganizar_posicoes
+        )
+        db.add(cliente)
+        db.flush()
+
+        db.query(Agendamento).filter(Agendamento.id == agendamento_id).update(
+            {Agendamento.cliente_id: cliente.id}, synchronize_session=False
+        )
+        db.commit()
+
+        reorganizar_posicoes(db)
+    finally:
+        db.close()
+
+
+roda_agendamentos = RodaTemporizadora(incluir_agendamento_na_fila)
+
+
+def repor_senhas(tipos: List[str], espera: float = None):
+    """
+    Repõe as senhas reservadas em memória, usadas pelo buffer de escrita
+    quando o banco está bloqueado. Se o banco continuar bloqueado, tenta de
+    novo na próxima chamada.
+    """
+    try:
+        gerador_senhas.preparar(tipos, espera=espera)
+    except OperationalError as e:
+        if not banco_bloqueado(e):
+            raise
+        logger.warning("Banco bloqueado; reserva de senhas será reposta depois")
+
+
+def gravar_lote_buffer(entradas: List[dict]):
+    """
+    Grava na tabela clientes um lote de entradas do buffer de escrita.
+    Entradas já gravadas em uma descarga anterior são ignoradas.
+    """
+    db = SessionLocal()
+    try:
+        ids = [entrada["id_buffer"] for entrada in entradas]
+        gravados = {
+            id_buffer for (id_buffer,) in
+            db.query(Cliente.id_buffer).filter(Cliente.id_buffer.in_(ids))
+        }
+
+        for entrada in entradas:
+            if entrada["id_buffer"] in gravados:
+                continue
+            db.add(Cliente(
+                nome=entrada["nome"],
+                tipo_atendimento=entrada["tipo_atendimento"],
+                senha=entrada["senha"],
+                data_chegada=datetime.fromisoformat(entrada["data_chegada"]),
+                atendido=False,
+                posicao=0,  # Será atualizado pela função reorganizar_posicoes
+                id_buffer=entrada["id_buffer"]
+            ))
+        db.commit()
+
+        reorganizar_posicoes(db)
+    finally:
+        db.close()
+
+    # Banco disponível de novo: repõe as senhas gastas enquanto estava bloqueado
+    repor_senhas(['P', 'N'])
+
+
+buffer_escrita = BufferEscrita(gravar_lote_buffer)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Carrega os agendamentos pendentes na roda temporizadora e a inicia.
+    A tabela de agendamentos só é lida aqui, na inicialização.
+    
+    Também reserva antecipadamente as senhas do dia, para que o buffer de
+    escrita tenha senhas mesmo que o banco fique bloqueado.
+    """
+    repor_senhas(['P', 'N'])
+
+    db = SessionLocal()
+    try:
+        pendentes = db.query(Agendamento).filter(Agendamento.enviado == False).all()
+        for agendamento in pendentes:
+            roda_agendamentos.agendar(agendamento.id, agendamento.horario)
+    finally:
+        db.close()
+
+    roda_agendamentos.iniciar()
+    buffer_escrita.iniciar()
+    yield
+    buffer_escrita.parar()
+    roda_agendamentos.parar()
+
+
 app = FastAPI(
     title="API Fila de Atendimento",
     description="API para gerenciamento de fila de atendimento presencial",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 
+@app.middleware("http")
+async def cabecalho_consultas(request: Request, call_next):
+    """
+    Em modo de depuração, adiciona à resposta a quantidade de consultas ao banco
+    (X-DB-Consultas) e o tempo gasto nelas (X-DB-Tempo-ms)
+    """
+    if not DEBUG_CONSULTAS:
+        return await call_next(request)
+
+    with contar_consultas() as contador:
+        response = await call_next(request)
+
+    response.headers["X-DB-Consultas"] = str(contador.total)
+    response.headers["X-DB-Tempo-ms"] = f"{contador.tempo * 1000:.2f}"
+    return response
+
+
 def reorganizar_posicoes(db: Session):
     """
     Reorganiza as posições da fila considerando prioridade
     Clientes prioritários (P) ficam na frente dos normais (N)
-    """
-    # Buscar todos os clientes não atendidos
-    clientes_prioritarios = db.query(Cliente).filter(
-        Cliente.atendido == False,
-        Cliente.tipo_atendimento == 'P'
-    ).order_by(Cliente.data_chegada).all()
-    
-    clientes_normais = db.query(Cliente).filter(
-        Cliente.atendido == False,
-        Cliente.tipo_atendimento == 'N'
-    ).order_by(Cliente.data_chegada).all()
-    
-    # Atribuir posições: prioritários primeiro, depois normais
-    posicao = 1
-    for cliente in clientes_prioritarios:
-        cliente.posicao = posicao
-        posicao += 1
-    
-    for cliente in clientes_normais:
-        cliente.posicao = posicao
-        posicao += 1
     
+    A fila inteira é renumerada em um único UPDATE no banco, em vez de um
+    UPDATE por cliente. A posição de cada cliente é a quantidade de clientes
+    não atendidos à frente dele, mais ele mesmo (subconsulta correlacionada,
+    suportada por qualquer versão do SQLite).
+    """
+    outro = aliased(Cliente)
+    
+    # Prioritários primeiro, depois normais, cada grupo por ordem de chegada
+    a_frente = or_(
+        and_(outro.tipo_atendimento == 'P', Cliente.tipo_atendimento != 'P'),
+        and_(
+            outro.tipo_atendimento == Cliente.tipo_atendimento,
+            or_(
+                outro.data_chegada < Cliente.data_chegada,
+                and_(outro.data_chegada == Cliente.data_chegada, outro.id <= Cliente.id)
+            )
+        )
+    )
+    nova_posicao = select(func.count()).select_from(outro).where(
+        outro.atendido == False,
+        a_frente
+    ).scalar_subquery()
+    
+    db.execute(
+        update(Cliente)
+        .where(Cliente.atendido == False)
+        .values(posicao=nova_posicao)
+        .execution_options(synchronize_session=False)
+    )
     db.commit()
 
 
+# Última leitura da fila no banco, exibida enquanto o banco estiver bloqueado
+# até para leitura (ex.: restauração de backup)
+_fila_banco: List[dict] = []
+
+
+def ler_fila_banco(db: Session) -> List[dict]:
+    """
+    Lê do banco os clientes não atendidos, ordenados por posição.
+    Se o banco estiver bloqueado, devolve a última leitura em vez de esperar.
+    """
+    global _fila_banco
+
+    definir_espera(db, TEMPO_ESPERA_ENTRADA)
+    try:
+        clientes = db.query(Cliente).filter(
+            Cliente.atendido == False
+        ).order_by(Cliente.posicao).all()
+    except OperationalError as e:
+        if not banco_bloqueado(e):
+            raise
+        db.rollback()
+        logger.warning("Banco bloqueado; exibindo a última leitura da fila")
+        return [dict(item) for item in _fila_banco]
+
+    _fila_banco = [
+        {
+            "posicao": cliente.posicao,
+            "senha": cliente.senha,
+            "nome": cliente.nome,
+            "data_chegada": cliente.data_chegada,
+            "tipo_atendimento": cliente.tipo_atendimento,
+            "id_buffer": cliente.id_buffer
+        }
+        for cliente in clientes
+    ]
+    return [dict(item) for item in _fila_banco]
+
+
+def montar_fila(db: Session) -> List[dict]:
+    """
+    Monta a fila combinando os clientes do banco com as entradas ainda no
+    buffer de escrita, na ordem de prioridade e de chegada
+    """
+    fila = ler_fila_banco(db)
+    gravados = {item["id_buffer"] for item in fila if item["id_buffer"]}
+
+    for entrada in buffer_escrita.pendentes():
+        if entrada["id_buffer"] in gravados:
+            continue
+        fila.append({
+            "senha": entrada["senha"],
+            "nome": entrada["nome"],
+            "data_chegada": datetime.fromisoformat(entrada["data_chegada"]),
+            "tipo_atendimento": entrada["tipo_atendimento"],
+            "id_buffer": entrada["id_buffer"]
+        })
+
+    # Prioritários primeiro, depois normais, cada grupo por ordem de chegada
+    fila.sort(key=lambda item: (item["tipo_atendimento"] != 'P', item["data_chegada"]))
+    for posicao, item in enumerate(fila, start=1):
+        item["posicao"] = posicao
+
+    return fila
+
+
+def adicionar_cliente_no_buffer(cliente_data: ClienteCreate, db: Session, senha: str = None) -> dict:
+    """
+    Registra o cliente no buffer de escrita e devolve a resposta imediatamente.
+    Se a fila não puder ser lida, a posição é estimada apenas pelo buffer.
+    
+    A senha sai apenas das senhas já reservadas em memória, sem esperar pelo
+    banco. O cliente nunca é confirmado sem senha: se não houver senha
+    disponível, retorna status 503.
+    """
+    if senha is None:
+        senha = gerador_senhas.proxima_senha(cliente_data.tipo_atendimento, reservar=False)
+    if senha is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"mensagem": "Não foi possível gerar a senha. Tente novamente em instantes."}
+        )
+
+    try:
+        entrada = buffer_escrita.registrar(cliente_data.nome, cliente_data.tipo_atendimento, senha)
+    except BufferCheioError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"mensagem": "Fila temporariamente indisponível. Tente novamente em instantes."}
+        )
+
+    try:
+        fila = montar_fila(db)
+    except OperationalError:
+        db.rollback()
+        fila = buffer_escrita.pendentes()
+
+    posicao = next(
+        (i for i, item in enumerate(fila, start=1) if item.get("id_buffer") == entrada["id_buffer"]),
+        0
+    )
+
+    return {
+        "posicao": posicao,
+        "senha": entrada["senha"],
+        "nome": entrada["nome"],
+        "data_chegada": entrada["data_chegada"],
+        "tipo_atendimento": entrada["tipo_atendimento"]
+    }
+
+
+def sincronizar_buffer():
+    """
+    Grava no banco as entradas do buffer de escrita antes de alterar a fila,
+    para que chamar ou remover clientes use as mesmas posições exibidas em GET /fila.
+    Se o banco continuar bloqueado, retorna status 503.
+    """
+    if not buffer_escrita.ativo:
+        return
+    try:
+        buffer_escrita.descarregar_tudo()
+    except OperationalError as e:
+        if not banco_bloqueado(e):
+            raise
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"mensagem": "Fila em sincronização. Tente novamente em instantes."}
+        )
+
+
 @app.get("/fila", response_model=List[ClienteResponse], status_code=status.HTTP_200_OK)
 def listar_fila(db: Session = Depends(get_db)):
     """
@@ -55,12 +360,15 @@ def listar_fila(db: Session = Depends(get_db)):
     Exibe a posição na fila, o nome e a data de chegada de cada cliente.
     
     Retorna lista vazia com status 200 se não houver ninguém na fila.
+    
+    Enquanto houver clientes no buffer de escrita, eles também são exibidos,
+    já na posição correta considerando prioridade. Se o banco estiver
+    bloqueado, exibe a última fila lida do banco.
     """
-    clientes = db.query(Cliente).filter(
-        Cliente.atendido == False
-    ).order_by(Cliente.posicao).all()
+    if buffer_escrita.ativo:
+        return montar_fila(db)
     
-    return clientes
+    return ler_fila_banco(db)
 
 
 @app.get("/fila/{id}", response_model=ClienteResponse, status_code=status.HTTP_200_OK)
@@ -72,11 +380,25 @@ def buscar_cliente_por_posicao(id: int, db: Session = Depends(get_db)):
     Retorna posição na fila, nome e data de chegada.
     
     Se não houver cliente na posição especificada, retorna status 404 com mensagem informativa.
+    
+    Se o banco estiver bloqueado, usa a última fila lida do banco.
     """
-    cliente = db.query(Cliente).filter(
-        Cliente.posicao == id,
-        Cliente.atendido == False
-    ).first()
+    if buffer_escrita.ativo:
+        fila = montar_fila(db)
+        cliente = fila[id - 1] if 0 < id <= len(fila) else None
+    else:
+        definir_espera(db, TEMPO_ESPERA_ENTRADA)
+        try:
+            cliente = db.query(Cliente).filter(
+                Cliente.posicao == id,
+                Cliente.atendido == False
+            ).first()
+        except OperationalError as e:
+            if not banco_bloqueado(e):
+                raise
+            db.rollback()
+            logger.warning("Banco bloqueado; exibindo a última leitura da fila")
+            cliente = next((item for item in _fila_banco if item["posicao"] == id), None)
     
     if not cliente:
         raise HTTPException(
@@ -99,29 +421,63 @@ def adicionar_cliente(cliente_data: ClienteCreate, db: Session = Depends(get_db)
     - tipo_atendimento: Caractere único (N para Normal ou P para Prioritário)
     
     O sistema identifica automaticamente a posição na fila considerando prioridade,
-    registra a data de entrada e seta o campo atendido como FALSE.
+    gera a senha do cliente (ex.: P001, N042), registra a data de entrada e seta
+    o campo atendido como FALSE.
     
     Clientes prioritários (P) são posicionados na frente dos clientes normais (N),
     respeitando a ordem de chegada dentro de cada categoria.
-    """
-    # Criar novo cliente
-    novo_cliente = Cliente(
-        nome=cliente_data.nome,
-        tipo_atendimento=cliente_data.tipo_atendimento,
-        data_chegada=datetime.now(),
-        atendido=False,
-        posicao=0  # Será atualizado pela função reorganizar_posicoes
-    )
     
-    db.add(novo_cliente)
-    db.commit()
-    
-    # Reorganizar todas as posições considerando prioridade
-    reorganizar_posicoes(db)
+    Se o banco estiver bloqueado, o cliente é gravado no buffer de escrita local
+    e confirmado na hora; a gravação no banco acontece em segundo plano.
+    Se o buffer estiver cheio, retorna status 503.
+    """
+    # Enquanto houver entradas no buffer, novas entradas seguem pelo buffer
+    # para preservar a ordem de chegada
+    if MODO_BUFFER or buffer_escrita.ativo:
+        return adicionar_cliente_no_buffer(cliente_data, db)
+    
+    # Espera curta pelo banco: se estiver bloqueado, segue pelo buffer
+    definir_espera(db, TEMPO_ESPERA_ENTRADA)
+    
+    # Senha tirada da memória antes do INSERT; só reserva no banco se acabou
+    senha = gerador_senhas.proxima_senha(cliente_data.tipo_atendimento, reservar=False)
+    try:
+        if senha is None:
+            senha = gerador_senhas.proxima_senha(
+                cliente_data.tipo_atendimento, espera=TEMPO_ESPERA_ENTRADA
+            )
+        
+        # Criar novo cliente
+        novo_cliente = Cliente(
+            nome=cliente_data.nome,
+            tipo_atendimento=cliente_data.tipo_atendimento,
+            senha=senha,
+            data_chegada=datetime.now(),
+            atendido=False,
+            posicao=0  # Será atualizado pela função reorganizar_posicoes
+        )
+        
+        db.add(novo_cliente)
+        db.flush()
+        
+        # Reorganizar todas as posições considerando prioridade, na mesma
+        # transação do INSERT: se o banco bloquear, nada fica gravado
+        reorganizar_posicoes(db)
+    except OperationalError as e:
+        if not banco_bloqueado(e):
+            raise
+        # Banco bloqueado: confirma a entrada pelo buffer de escrita
+        db.rollback()
+        return adicionar_cliente_no_buffer(cliente_data, db, senha)
+    
+    # Cliente já gravado: a partir daqui não pode mais seguir pelo buffer
+    definir_espera(db, TEMPO_ESPERA_PADRAO)
     
     # Atualizar o objeto com a nova posição
     db.refresh(novo_cliente)
     
+    repor_senhas([cliente_data.tipo_atendimento], espera=TEMPO_ESPERA_ENTRADA)
+    
     return novo_cliente
 
 
@@ -137,7 +493,11 @@ def chamar_proximo_cliente(db: Session = Depends(get_db)):
     atendido é setado para TRUE, indicando que foi chamado para atendimento.
     
     Os demais clientes têm suas posições atualizadas automaticamente.
+    
+    Clientes ainda no buffer de escrita são gravados no banco antes da chamada.
     """
+    sincronizar_buffer()
+    
     # Buscar o cliente na posição 1
     cliente_posicao_1 = db.query(Cliente).filter(
         Cliente.posicao == 1,
@@ -172,7 +532,11 @@ def remover_cliente(id: int, db: Session = Depends(get_db)):
     
     Se o cliente não for encontrado na posição especificada, retorna status 404
     com mensagem informativa.
+    
+    Clientes ainda no buffer de escrita são gravados no banco antes da remoção.
     """
+    sincronizar_buffer()
+    
     # Buscar cliente na posição especificada
     cliente = db.query(Cliente).filter(
         Cliente.posicao == id,
@@ -197,6 +561,52 @@ def remover_cliente(id: int, db: Session = Depends(get_db)):
     return {"mensagem": f"Cliente {nome_removido} removido da posição {id}. Fila atualizada."}
 
 
+@app.post("/agendamentos", response_model=AgendamentoResponse, status_code=status.HTTP_201_CREATED)
+def criar_agendamento(agendamento_data: AgendamentoCreate, db: Session = Depends(get_db)):
+    """
+    POST /agendamentos
+    
+    Agenda a entrada de um cliente na fila em um horário definido.
+    
+    Parâmetros:
+    - nome: String obrigatória com máximo de 20 caracteres
+    - tipo_atendimento: Caractere único (N para Normal ou P para Prioritário)
+    - horario: Data e hora em que o cliente deve entrar na fila
+    
+    No horário marcado o cliente entra automaticamente na fila, recebe sua senha
+    e é posicionado considerando prioridade. Horários já passados entram na fila
+    imediatamente.
+    """
+    agendamento = Agendamento(
+        nome=agendamento_data.nome,
+        tipo_atendimento=agendamento_data.tipo_atendimento,
+        horario=agendamento_data.horario,
+        enviado=False
+    )
+    
+    db.add(agendamento)
+    db.commit()
+    db.refresh(agendamento)
+    
+    roda_agendamentos.agendar(agendamento.id, agendamento.horario)
+    
+    return agendamento
+
+
+@app.get("/agendamentos", response_model=List[AgendamentoResponse], status_code=status.HTTP_200_OK)
+def listar_agendamentos(db: Session = Depends(get_db)):
+    """
+    GET /agendamentos
+    
+    Retorna os agendamentos que ainda não entraram na fila, ordenados por horário.
+    """
+    agendamentos = db.query(Agendamento).filter(
+        Agendamento.enviado == False
+    ).order_by(Agendamento.horario).all()
+    
+    return agendamentos
+
+
 @app.get("/", response_model=dict)
 def root():
     """
@@ -210,7 +620,9 @@ def root():
             "GET /fila/{id}": "Buscar cliente por posição",
             "POST /fila": "Adicionar novo cliente na fila",
             "PUT /fila": "Chamar próximo cliente para atendimento",
-            "DELETE /fila/{id}": "Remover cliente da posição especificada"
+            "DELETE /fila/{id}": "Remover cliente da posição especificada",
+            "GET /agendamentos": "Listar agendamentos pendentes",
+            "POST /agendamentos": "Agendar entrada de cliente na fila"
         }
     }
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date
 from datetime import datetime
 from database import Base
 
@@ -13,9 +13,44 @@ class Cliente(Base):
     nome = Column(String(20), nullable=False)
     tipo_atendimento = Column(String(1), nullable=False)  # N = Normal, P = Prioritário
     posicao = Column(Integer, nullable=False)
+    senha = Column(String(8), index=True, nullable=True)  # Ex.: P001, N042
     data_chegada = Column(DateTime, default=datetime.now, nullable=False)
     atendido = Column(Boolean, default=False, nullable=False)
+    id_buffer = Column(String(32), unique=True, index=True, nullable=True)  # Entrada do buffer de escrita
 
     def __repr__(self):
-        return f"<Cliente(nome='{self.nome}', posicao={self.posicao}, tipo='{self.tipo_atendimento}')>"
+        return f"<Cliente(nome='{self.nome}', senha='{self.senha}', posicao={self.posicao}, tipo='{self.tipo_atendimento}')>"
 
+
+class SequenciaSenha(Base):
+    """
+    Marca d'água das senhas reservadas por dia e tipo de atendimento.
+    Guarda o último número já reservado em bloco pelo gerador de senhas.
+    """
+    __tablename__ = "sequencias_senha"
+
+    data = Column(Date, primary_key=True)
+    tipo_atendimento = Column(String(1), primary_key=True)
+    reservado_ate = Column(Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<SequenciaSenha(data={self.data}, tipo='{self.tipo_atendimento}', reservado_ate={self.reservado_ate})>"
+
+
+class Agendamento(Base):
+    """
+    Modelo de dados para atendimento agendado.
+    O cliente entra na fila automaticamente no horário marcado.
+    """
+    __tablename__ = "agendamentos"
+
+    id = Column(Integer, primary_key=True, index=True)
+    nome = Column(String(20), nullable=False)
+    tipo_atendimento = Column(String(1), nullable=False)  # N = Normal, P = Prioritário
+    horario = Column(DateTime, nullable=False, index=True)
+    data_criacao = Column(DateTime, default=datetime.now, nullable=False)
+    enviado = Column(Boolean, default=False, nullable=False)  # TRUE quando já entrou na fila
+    cliente_id = Column(Integer, nullable=True)
+
+    def __repr__(self):
+        return f"<Agendamento(nome='{self.nome}', horario={self.horario}, enviado={self.enviado})>"
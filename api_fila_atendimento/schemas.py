@@ -32,6 +32,7 @@ class ClienteResponse(BaseModel):
     Schema para resposta de dados do cliente
     """
     posicao: int
+    senha: Optional[str] = None
     nome: str
     data_chegada: datetime
     tipo_atendimento: str
@@ -40,6 +41,35 @@ class ClienteResponse(BaseModel):
         from_attributes = True
 
 
+class AgendamentoCreate(ClienteCreate):
+    """
+    Schema para agendar a entrada de um cliente na fila
+    """
+    horario: datetime = Field(..., description="Data e hora em que o cliente entra na fila")
+
+    @field_validator('horario')
+    @classmethod
+    def validar_horario(cls, v):
+        # Horários com fuso são convertidos para o horário local, como data_chegada
+        if v.tzinfo is not None:
+            return v.astimezone().replace(tzinfo=None)
+        return v
+
+
+class AgendamentoResponse(BaseModel):
+    """
+    Schema para resposta de dados do agendamento
+    """
+    id: int
+    nome: str
+    tipo_atendimento: str
+    horario: datetime
+    enviado: bool
+
+    class Config:
+        from_attributes = True
+
+
 class MensagemResponse(BaseModel):
     """
     Schema para mensagens de resposta
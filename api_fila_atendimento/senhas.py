@@ -0,0 +1,186 @@
+"""
+Geração de senhas de atendimento (ex.: P001, N042)
+
+As senhas recomeçam a cada dia e são contadas separadamente para cada tipo
+de atendimento. Os números são reservados no banco em blocos e distribuídos
+a partir da memória, de modo que o banco só é consultado uma vez por bloco.
+
+Além das senhas em uso, cada tipo mantém em memória uma reserva do tamanho
+do buffer de escrita (LIMITE_BUFFER). Assim, com o banco bloqueado, o buffer
+consegue confirmar todos os clientes que cabem nele sem consultar o banco
+(ver buffer_escrita.py). A reserva é reposta fora do caminho das requisições
+bufferizadas, por preparar().
+
+Se a API cair, as senhas reservadas e não usadas são descartadas: a sequência
+pode ter lacunas, mas nunca repete uma senha no mesmo dia.
+"""
+import logging
+import math
+import threading
+from datetime import date
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from buffer_escrita import LIMITE_BUFFER
+from database import SessionLocal, definir_espera
+from models import SequenciaSenha
+
+logger = logging.getLogger(__name__)
+
+# Quantidade mínima de números reservados no banco a cada ida
+TAMANHO_BLOCO_SENHAS = 20
+
+# Senhas mantidas em memória por tipo, além do bloco em uso
+RESERVA_SENHAS = LIMITE_BUFFER
+
+
+class GeradorSenhas:
+    """
+    Distribui senhas a partir de blocos reservados no banco (tabela sequencias_senha)
+    """
+
+    def __init__(self, tamanho_bloco: int = TAMANHO_BLOCO_SENHAS, reserva: int = RESERVA_SENHAS,
+                 session_factory: Callable = SessionLocal):
+        self.tamanho_bloco = tamanho_bloco
+        self.reserva = reserva
+        self.session_factory = session_factory
+        # (data, tipo) -> blocos [próximo número, último número], em ordem crescente
+        self._blocos: Dict[Tuple[date, str], List[list]] = {}
+        # Protege os blocos em memória; nunca fica com ele enquanto consulta o banco
+        self._lock = threading.Lock()
+        # Uma reserva no banco por vez
+        self._lock_reserva = threading.Lock()
+
+    def proxima_senha(self, tipo_atendimento: str, dia: date = None,
+                      reservar: bool = True, espera: float = None) -> Optional[str]:
+        """
+        Retorna a próxima senha do dia para o tipo de atendimento informado.
+
+        Com reservar=False o banco nunca é consultado: retorna None se não houver
+        senha em memória. Com reservar=True, sem senhas em memória, reserva um
+        bloco no banco antes de responder.
+
+        espera limita, em segundos, a espera pelo banco bloqueado e por outra
+        reserva em andamento; se esta não terminar a tempo, retorna None.
+        """
+        dia = dia or date.today()
+
+        senha = self._retirar(dia, tipo_atendimento)
+        if senha is not None or not reservar:
+            return senha
+
+        if not self._lock_reserva.acquire(timeout=-1 if espera is None else espera):
+            return None
+        try:
+            # Outra thread pode ter reservado enquanto esta esperava
+            senha = self._retirar(dia, tipo_atendimento)
+            while senha is None:
+                bloco = self._reservar_bloco(dia, tipo_atendimento, self.tamanho_bloco, espera)
+                self._guardar(dia, tipo_atendimento, bloco)
+                senha = self._retirar(dia, tipo_atendimento)
+        finally:
+            self._lock_reserva.release()
+
+        return senha
+
+    def preparar(self, tipos: Iterable[str], dia: date = None, espera: float = None):
+        """
+        Repõe as senhas em memória de cada tipo até o bloco em uso mais a reserva.
+
+        Só consulta o banco quando falta senha, em blocos múltiplos de
+        tamanho_bloco. Se outra thread já está reservando, retorna sem esperar.
+        """
+        dia = dia or date.today()
+
+        if not self._lock_reserva.acquire(blocking=False):
+            return
+        try:
+            for tipo_atendimento in tipos:
+                falta = self.tamanho_bloco + self.reserva - self.disponiveis(tipo_atendimento, dia)
+                if falta > 0:
+                    quantidade = math.ceil(falta / self.tamanho_bloco) * self.tamanho_bloco
+                    bloco = self._reservar_bloco(dia, tipo_atendimento, quantidade, espera)
+                    self._guardar(dia, tipo_atendimento, bloco)
+        finally:
+            self._lock_reserva.release()
+
+    def disponiveis(self, tipo_atendimento: str, dia: date = None) -> int:
+        """
+        Quantidade de senhas do dia já reservadas e ainda não entregues
+        """
+        dia = dia or date.today()
+        with self._lock:
+            blocos = self._blocos.get((dia, tipo_atendimento), [])
+            return sum(fim - inicio + 1 for inicio, fim in blocos)
+
+    def _retirar(self, dia: date, tipo_atendimento: str) -> Optional[str]:
+        with self._lock:
+            blocos = self._blocos.get((dia, tipo_atendimento))
+            if not blocos:
+                return None
+
+            numero = blocos[0][0]
+            blocos[0][0] += 1
+            if blocos[0][0] > blocos[0][1]:
+                blocos.pop(0)
+
+        return f"{tipo_atendimento}{numero:03d}"
+
+    def _guardar(self, dia: date, tipo_atendimento: str, bloco: list):
+        chave = (dia, tipo_atendimento)
+        with self._lock:
+            if chave not in self._blocos:
+                # Blocos de dias anteriores não serão mais usados
+                self._blocos = {k: v for k, v in self._blocos.items() if k[0] >= dia}
+                self._blocos[chave] = []
+            self._blocos[chave].append(bloco)
+            self._blocos[chave].sort()
+
+    def _reservar_bloco(self, dia: date, tipo_atendimento: str, quantidade: int,
+                        espera: float = None) -> list:
+        """
+        Avança a marca d'água no banco em `quantidade` números e retorna o
+        intervalo reservado
+        """
+        db = self.session_factory()
+        try:
+            if espera is not None:
+                definir_espera(db, espera)
+            for _ in range(2):
+                filtro = db.query(SequenciaSenha).filter(
+                    SequenciaSenha.data == dia,
+                    SequenciaSenha.tipo_atendimento == tipo_atendimento
+                )
+
+                # UPDATE atômico: dois processos nunca recebem o mesmo bloco
+                atualizadas = filtro.update(
+                    {SequenciaSenha.reservado_ate: SequenciaSenha.reservado_ate + quantidade},
+                    synchronize_session=False
+                )
+                if atualizadas == 0:
+                    db.add(SequenciaSenha(
+                        data=dia,
+                        tipo_atendimento=tipo_atendimento,
+                        reservado_ate=quantidade
+                    ))
+                    try:
+                        db.flush()
+                    except IntegrityError:
+                        # Outro processo criou a sequência do dia ao mesmo tempo
+                        db.rollback()
+                        continue
+
+                reservado_ate = filtro.with_entities(SequenciaSenha.reservado_ate).scalar()
+                db.commit()
+
+                return [reservado_ate - quantidade + 1, reservado_ate]
+
+            raise RuntimeError(
+                f"Não foi possível reservar senhas para o tipo {tipo_atendimento} em {dia}"
+            )
+        finally:
+            db.close()
+
+
+gerador_senhas = GeradorSenhas()
@@ -0,0 +1,108 @@
+"""
+Testes da roda temporizadora e dos agendamentos
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import main
+from agendador import RodaTemporizadora
+from database import SessionLocal
+from models import Agendamento, Cliente
+
+
+def criar_roda(compartimentos=4):
+    disparados = []
+    roda = RodaTemporizadora(disparados.append, intervalo=1.0, compartimentos=compartimentos)
+    return roda, disparados
+
+
+def test_agendamento_alem_de_uma_volta():
+    roda, disparados = criar_roda(compartimentos=4)
+    roda.agendar("a", datetime.now() + timedelta(seconds=10))
+
+    for _ in range(10):
+        roda.girar()
+    assert disparados == []
+
+    roda.girar()
+    assert disparados == ["a"]
+
+
+def test_nunca_dispara_antes_do_horario():
+    roda, disparados = criar_roda()
+    # Último giro há 0.9s: o próximo acontece antes do horário agendado
+    roda._ultimo_giro = time.monotonic() - 0.9
+    roda.agendar("a", datetime.now() + timedelta(seconds=0.5))
+
+    roda.girar()
+    assert disparados == []
+
+    roda.girar()
+    assert disparados == ["a"]
+
+
+def test_horario_passado_dispara_no_proximo_giro():
+    roda, disparados = criar_roda()
+    roda.agendar("a", datetime.now() - timedelta(minutes=5))
+
+    roda.girar()
+    assert disparados == ["a"]
+
+
+def test_disparo_com_falha_e_tentado_novamente():
+    chamadas = []
+
+    def disparar(item):
+        chamadas.append(item)
+        if len(chamadas) == 1:
+            raise RuntimeError("banco bloqueado")
+
+    roda = RodaTemporizadora(disparar, intervalo=1.0, compartimentos=4)
+    roda.agendar("a", datetime.now())
+
+    roda.girar()
+    assert chamadas == ["a"]
+
+    for _ in range(3):
+        roda.girar()
+    assert chamadas == ["a", "a"]
+
+    for _ in range(8):
+        roda.girar()
+    assert chamadas == ["a", "a"]
+
+
+def test_agendamento_entra_na_fila_uma_unica_vez(cliente_api):
+    """
+    Vários processos disparando o mesmo agendamento criam um único cliente
+    """
+    db = SessionLocal()
+    agendamento = Agendamento(
+        nome="Agendado", tipo_atendimento="P", horario=datetime.now(), enviado=False
+    )
+    db.add(agendamento)
+    db.commit()
+    agendamento_id = agendamento.id
+    db.close()
+
+    barreira = threading.Barrier(4)
+
+    def disparar():
+        barreira.wait()
+        main.incluir_agendamento_na_fila(agendamento_id)
+
+    threads = [threading.Thread(target=disparar) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    db = SessionLocal()
+    try:
+        assert db.query(Cliente).filter(Cliente.nome == "Agendado").count() == 1
+        agendamento = db.get(Agendamento, agendamento_id)
+        assert agendamento.enviado
+        assert agendamento.cliente_id is not None
+    finally:
+        db.close()
@@ -0,0 +1,224 @@
+"""
+Testes do buffer de escrita local (write-ahead)
+"""
+import os
+import time
+
+import pytest
+
+import main
+from buffer_escrita import BufferEscrita, LIMITE_BUFFER
+from database import SessionLocal, engine, TEMPO_ESPERA_PADRAO
+from models import Cliente
+from senhas import GeradorSenhas
+
+
+@pytest.fixture
+def buffer_pausado(cliente_api, monkeypatch):
+    """
+    Envia as novas entradas ao buffer e interrompe a descarga em segundo plano,
+    deixando-as pendentes como se o banco estivesse bloqueado
+    """
+    main.buffer_escrita.parar()
+    monkeypatch.setattr(main, "MODO_BUFFER", True)
+    yield main.buffer_escrita
+    main.buffer_escrita.descarregar_tudo()
+
+
+def adicionar(cliente_api, nome, tipo):
+    response = cliente_api.post("/fila", json={"nome": nome, "tipo_atendimento": tipo})
+    assert response.status_code == 201
+    return response.json()
+
+
+def nomes_na_fila(cliente_api):
+    return [cliente["nome"] for cliente in cliente_api.get("/fila").json()]
+
+
+def test_chamar_e_remover_usam_posicoes_com_buffer(cliente_api, monkeypatch):
+    adicionar(cliente_api, "N1", "N")
+    adicionar(cliente_api, "N2", "N")
+
+    main.buffer_escrita.parar()
+    monkeypatch.setattr(main, "MODO_BUFFER", True)
+    adicionar(cliente_api, "P1", "P")
+    assert main.buffer_escrita.ativo
+    assert nomes_na_fila(cliente_api) == ["P1", "N1", "N2"]
+
+    # PUT chama quem GET /fila mostra na posição 1
+    response = cliente_api.put("/fila")
+    assert response.status_code == 200
+    assert "P1" in response.json()["mensagem"]
+    assert nomes_na_fila(cliente_api) == ["N1", "N2"]
+
+    adicionar(cliente_api, "N3", "N")
+    assert cliente_api.get("/fila/2").json()["nome"] == "N2"
+
+    # DELETE remove quem GET /fila/{id} mostra na mesma posição
+    response = cliente_api.delete("/fila/2")
+    assert response.status_code == 200
+    assert "N2" in response.json()["mensagem"]
+    assert nomes_na_fila(cliente_api) == ["N1", "N3"]
+    assert not main.buffer_escrita.ativo
+
+
+def test_entradas_recuperadas_apos_queda(tmp_path):
+    gravados = []
+    anterior = BufferEscrita(gravados.extend, diretorio=str(tmp_path), identificador="a")
+    anterior.registrar("Primeiro", "N", "N001")
+    anterior.registrar("Segundo", "P", "P001")
+
+    # Queda do processo: a trava é liberada com uma gravação pela metade no arquivo
+    anterior._arquivo.write('{"id_buffer": "incomp')
+    anterior._arquivo.close()
+    anterior._arquivo = None
+
+    novo = BufferEscrita(gravados.extend, diretorio=str(tmp_path), identificador="b")
+    novo.iniciar()
+    novo.descarregar_tudo()
+    novo.parar()
+
+    assert [entrada["nome"] for entrada in gravados] == ["Primeiro", "Segundo"]
+    assert os.listdir(tmp_path) == []
+
+
+def test_arquivo_de_processo_vivo_nao_e_assumido(tmp_path):
+    gravados = []
+    vivo = BufferEscrita(gravados.extend, diretorio=str(tmp_path), identificador="a")
+    vivo.registrar("Cliente", "N", "N001")
+
+    outro = BufferEscrita(gravados.extend, diretorio=str(tmp_path), identificador="b")
+    outro.iniciar()
+    outro.parar()
+
+    assert gravados == []
+    assert vivo.pendentes()[0]["nome"] == "Cliente"
+    assert os.listdir(tmp_path) == ["fila_pendente.a.wal"]
+    vivo.parar()
+
+
+def test_entrada_repetida_nao_duplica_cliente(cliente_api, tmp_path):
+    buffer = BufferEscrita(main.gravar_lote_buffer, diretorio=str(tmp_path), identificador="a")
+    entrada = buffer.registrar("Repetido", "N", "N900")
+
+    # Queda depois de gravar no banco e antes de limpar o arquivo: o lote é gravado de novo
+    main.gravar_lote_buffer([entrada])
+    main.gravar_lote_buffer([entrada])
+    buffer.descarregar_tudo()
+    buffer.parar()
+
+    db = SessionLocal()
+    try:
+        assert db.query(Cliente).filter(Cliente.id_buffer == entrada["id_buffer"]).count() == 1
+    finally:
+        db.close()
+
+
+def test_buffer_cheio_retorna_503(buffer_pausado, cliente_api, monkeypatch):
+    monkeypatch.setattr(buffer_pausado, "limite", 1)
+
+    adicionar(cliente_api, "Cabe", "N")
+    response = cliente_api.post("/fila", json={"nome": "Excede", "tipo_atendimento": "N"})
+
+    assert response.status_code == 503
+    assert [entrada["nome"] for entrada in buffer_pausado.pendentes()] == ["Cabe"]
+
+
+def test_fila_combinada_em_ordem_de_prioridade(cliente_api, monkeypatch):
+    adicionar(cliente_api, "N1", "N")
+    adicionar(cliente_api, "P1", "P")
+
+    main.buffer_escrita.parar()
+    monkeypatch.setattr(main, "MODO_BUFFER", True)
+    adicionar(cliente_api, "N2", "N")
+    confirmado = adicionar(cliente_api, "P2", "P")
+
+    assert confirmado["posicao"] == 2
+    assert confirmado["senha"].startswith("P")
+
+    fila = cliente_api.get("/fila").json()
+    assert [(c["posicao"], c["nome"]) for c in fila] == [(1, "P1"), (2, "P2"), (3, "N1"), (4, "N2")]
+    assert cliente_api.get("/fila/2").json()["nome"] == "P2"
+
+    # Depois da descarga, o banco tem a mesma ordem
+    main.buffer_escrita.descarregar_tudo()
+    assert cliente_api.get("/fila").json() == fila
+
+
+def test_cliente_nunca_confirmado_sem_senha(buffer_pausado, cliente_api, monkeypatch):
+    adicionar(cliente_api, "Pendente", "N")
+
+    # Banco bloqueado (buffer ativo, fora do modo buffer) e nenhuma senha em memória
+    monkeypatch.setattr(main, "MODO_BUFFER", False)
+    monkeypatch.setattr(main, "gerador_senhas", GeradorSenhas())
+    response = cliente_api.post("/fila", json={"nome": "Sem senha", "tipo_atendimento": "P"})
+
+    assert response.status_code == 503
+    assert len(buffer_pausado.pendentes()) == 1
+
+
+def test_buffer_enche_com_banco_travado(buffer_pausado, cliente_api, travar_banco, monkeypatch):
+    """
+    Com o banco travado, o buffer aceita clientes até o limite, além do
+    tamanho de um bloco de senhas, sem esperar pelo banco
+    """
+    assert GeradorSenhas().reserva >= LIMITE_BUFFER
+
+    monkeypatch.setattr(buffer_pausado, "limite", 30)
+    gerador = GeradorSenhas(tamanho_bloco=5, reserva=30)
+    gerador.preparar(["N"])
+    monkeypatch.setattr(main, "gerador_senhas", gerador)
+    travar_banco()
+
+    inicio = time.monotonic()
+    senhas = [adicionar(cliente_api, f"C{i}", "N")["senha"] for i in range(30)]
+    assert time.monotonic() - inicio < 2
+
+    assert len(set(senhas)) == 30
+    assert None not in senhas
+
+    response = cliente_api.post("/fila", json={"nome": "Excede", "tipo_atendimento": "N"})
+    assert response.status_code == 503
+
+
+def test_banco_travado_segue_pelo_buffer_sem_esperar(cliente_api, travar_banco):
+    adicionar(cliente_api, "Antes", "N")
+    conexao = travar_banco()
+
+    inicio = time.monotonic()
+    confirmado = adicionar(cliente_api, "Travado", "N")
+    assert time.monotonic() - inicio < 1
+
+    assert confirmado["senha"] is not None
+    assert confirmado["posicao"] == 2
+    assert main.buffer_escrita.ativo
+
+    # A espera curta vale só para a requisição; a conexão volta ao pool com a padrão
+    with engine.connect() as outra:
+        espera = outra.exec_driver_sql("PRAGMA busy_timeout").scalar()
+    assert espera == TEMPO_ESPERA_PADRAO * 1000
+
+    conexao.rollback()
+    main.buffer_escrita.descarregar_tudo()
+    assert nomes_na_fila(cliente_api) == ["Antes", "Travado"]
+
+
+def test_fila_exibida_com_banco_travado_para_leitura(cliente_api, travar_banco):
+    adicionar(cliente_api, "N1", "N")
+    adicionar(cliente_api, "P1", "P")
+    fila = cliente_api.get("/fila").json()
+    conexao = travar_banco("EXCLUSIVE")
+
+    inicio = time.monotonic()
+    assert cliente_api.get("/fila").json() == fila
+    assert cliente_api.get("/fila/2").json()["nome"] == "N1"
+    assert cliente_api.get("/fila/3").status_code == 404
+
+    # Novas entradas aparecem junto com a última leitura do banco
+    adicionar(cliente_api, "N2", "N")
+    assert nomes_na_fila(cliente_api) == ["P1", "N1", "N2"]
+    assert time.monotonic() - inicio < 3
+
+    conexao.rollback()
+    main.buffer_escrita.descarregar_tudo()
+    assert nomes_na_fila(cliente_api) == ["P1", "N1", "N2"]
@@ -0,0 +1,125 @@
+"""
+Testes de orçamento de consultas ao banco por endpoint
+
+Cada endpoint deve executar um número fixo de consultas, independente do
+tamanho da fila. Os limites já incluem a reserva de um bloco de senhas
+(3 consultas) quando ela cai na requisição. Os GETs da fila usam um PRAGMA
+busy_timeout para encurtar a espera pelo banco bloqueado; o POST /fila usa
+dois, para encurtar e restaurar a espera.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import main
+from consultas import contar_consultas
+from database import engine
+from senhas import GeradorSenhas
+
+TAMANHO_FILA = 25
+
+
+def preencher_fila(cliente_api, quantidade=TAMANHO_FILA):
+    for i in range(quantidade):
+        cliente_api.post("/fila", json={"nome": f"Cliente {i}", "tipo_atendimento": "NP"[i % 2]})
+
+
+@pytest.mark.parametrize("metodo, url, corpo, limite", [
+    ("get", "/fila", None, 2),
+    ("get", "/fila/3", None, 2),
+    ("post", "/fila", {"nome": "Novo", "tipo_atendimento": "P"}, 8),
+    ("put", "/fila", None, 4),
+    ("delete", "/fila/3", None, 3),
+])
+def test_orcamento_consultas_fila(cliente_api, limite_consultas, metodo, url, corpo, limite):
+    preencher_fila(cliente_api)
+
+    with limite_consultas(limite):
+        kwargs = {"json": corpo} if corpo is not None else {}
+        response = getattr(cliente_api, metodo)(url, **kwargs)
+
+    assert response.status_code < 400
+
+
+def test_orcamento_consultas_agendamento(cliente_api, limite_consultas):
+    horario = (datetime.now() + timedelta(hours=1)).isoformat()
+
+    with limite_consultas(2):
+        response = cliente_api.post(
+            "/agendamentos",
+            json={"nome": "Agendado", "tipo_atendimento": "N", "horario": horario}
+        )
+
+    assert response.status_code == 201
+
+
+def test_consultas_nao_crescem_com_a_fila(cliente_api, limite_consultas, monkeypatch):
+    """
+    Adicionar um cliente com a fila curta ou longa custa o mesmo número de consultas
+    """
+    # Bloco grande o bastante para nenhuma reserva de senhas cair nas medições
+    monkeypatch.setattr(main, "gerador_senhas", GeradorSenhas(tamanho_bloco=1000))
+
+    preencher_fila(cliente_api, 2)
+    with limite_consultas(5) as fila_curta:
+        cliente_api.post("/fila", json={"nome": "Curta", "tipo_atendimento": "N"})
+
+    preencher_fila(cliente_api, 200)
+    with limite_consultas(5) as fila_longa:
+        cliente_api.post("/fila", json={"nome": "Longa", "tipo_atendimento": "N"})
+
+    assert fila_longa.total == fila_curta.total
+
+
+def test_limite_excedido_aponta_consultas_repetidas(cliente_api, limite_consultas):
+    preencher_fila(cliente_api, 3)
+
+    with pytest.raises(pytest.fail.Exception, match="possível N\\+1"):
+        with limite_consultas(2):
+            for posicao in (1, 2, 3):
+                cliente_api.get(f"/fila/{posicao}")
+
+
+def test_cabecalho_debug_consultas(cliente_api, monkeypatch):
+    monkeypatch.setattr(main, "DEBUG_CONSULTAS", True)
+
+    response = cliente_api.post("/fila", json={"nome": "Debug", "tipo_atendimento": "N"})
+    assert int(response.headers["X-DB-Consultas"]) > 0
+    assert float(response.headers["X-DB-Tempo-ms"]) >= 0
+
+    response = cliente_api.get("/")
+    assert response.headers["X-DB-Consultas"] == "0"
+
+
+def test_cabecalho_debug_desligado(cliente_api, monkeypatch):
+    monkeypatch.setattr(main, "DEBUG_CONSULTAS", False)
+
+    response = cliente_api.get("/fila")
+    assert "X-DB-Consultas" not in response.headers
+
+
+def test_executemany_conta_cada_conjunto_de_parametros():
+    with engine.begin() as conexao:
+        with contar_consultas(todas_as_threads=True) as contador:
+            # Um único executemany, como o ORM faz ao atualizar várias linhas
+            conexao.execute(
+                text("UPDATE clientes SET posicao = posicao WHERE id = :id"),
+                [{"id": id_cliente} for id_cliente in range(5)]
+            )
+
+    assert contador.total == 5
+    assert contador.repetidas() == [("UPDATE clientes SET posicao = posicao WHERE id = ?", 5)]
+
+
+def test_instrucao_com_erro_e_contada():
+    with engine.connect() as conexao:
+        with contar_consultas(todas_as_threads=True) as contador:
+            with pytest.raises(OperationalError):
+                conexao.execute(text("SELECT * FROM tabela_inexistente"))
+
+        assert contador.total == 1
+        assert contador.instrucoes == ["SELECT * FROM tabela_inexistente"]
+        # O início da instrução não fica acumulado na conexão
+        assert conexao.info["inicio_consultas"] == []
@@ -0,0 +1,128 @@
+"""
+Testes do gerador de senhas de atendimento
+"""
+from datetime import date
+
+from consultas import contar_consultas
+from database import SessionLocal
+from models import SequenciaSenha
+from senhas import GeradorSenhas
+
+
+def reservado_ate(dia, tipo):
+    db = SessionLocal()
+    try:
+        return db.query(SequenciaSenha.reservado_ate).filter(
+            SequenciaSenha.data == dia,
+            SequenciaSenha.tipo_atendimento == tipo
+        ).scalar()
+    finally:
+        db.close()
+
+
+def test_senhas_sequenciais_por_tipo():
+    gerador = GeradorSenhas()
+    dia = date(2001, 1, 1)
+
+    assert [gerador.proxima_senha("P", dia) for _ in range(3)] == ["P001", "P002", "P003"]
+    assert [gerador.proxima_senha("N", dia) for _ in range(2)] == ["N001", "N002"]
+    assert gerador.proxima_senha("P", dia) == "P004"
+
+
+def test_senhas_recomecam_a_cada_dia():
+    gerador = GeradorSenhas()
+
+    assert gerador.proxima_senha("N", date(2001, 2, 1)) == "N001"
+    assert gerador.proxima_senha("N", date(2001, 2, 1)) == "N002"
+    assert gerador.proxima_senha("N", date(2001, 2, 2)) == "N001"
+
+
+def test_banco_consultado_uma_vez_por_bloco():
+    gerador = GeradorSenhas(tamanho_bloco=5)
+    dia = date(2001, 3, 1)
+
+    gerador.proxima_senha("N", dia)
+    assert reservado_ate(dia, "N") == 5
+
+    with contar_consultas(todas_as_threads=True) as contador:
+        senhas = [gerador.proxima_senha("N", dia) for _ in range(4)]
+    assert senhas == ["N002", "N003", "N004", "N005"]
+    assert contador.total == 0
+
+    # Bloco esgotado: um novo bloco é reservado
+    assert gerador.proxima_senha("N", dia) == "N006"
+    assert reservado_ate(dia, "N") == 10
+
+
+def test_reserva_usada_sem_consultar_banco():
+    gerador = GeradorSenhas(tamanho_bloco=2, reserva=2)
+    dia = date(2001, 3, 2)
+    gerador.preparar(["P"], dia)
+
+    with contar_consultas(todas_as_threads=True) as contador:
+        senhas = [gerador.proxima_senha("P", dia, reservar=False) for _ in range(5)]
+
+    assert senhas == ["P001", "P002", "P003", "P004", None]
+    assert contador.total == 0
+
+
+def test_preparar_repoe_reserva_em_blocos():
+    gerador = GeradorSenhas(tamanho_bloco=5, reserva=10)
+    dia = date(2001, 3, 4)
+
+    gerador.preparar(["N"], dia)
+    assert reservado_ate(dia, "N") == 15
+    assert gerador.disponiveis("N", dia) == 15
+
+    # Uma senha gasta: repõe um bloco inteiro
+    gerador.proxima_senha("N", dia, reservar=False)
+    gerador.preparar(["N"], dia)
+    assert reservado_ate(dia, "N") == 20
+    assert gerador.disponiveis("N", dia) == 19
+
+    # Reserva completa: o banco não é consultado
+    with contar_consultas(todas_as_threads=True) as contador:
+        gerador.preparar(["N"], dia)
+    assert contador.total == 0
+
+
+def test_senha_em_memoria_nao_espera_reserva_em_andamento():
+    gerador = GeradorSenhas(tamanho_bloco=2, reserva=0)
+    dia = date(2001, 3, 5)
+    gerador.preparar(["P"], dia)
+
+    # Outra thread reservando no banco (ex.: esperando o banco bloqueado)
+    with gerador._lock_reserva:
+        assert gerador.proxima_senha("P", dia, reservar=False) == "P001"
+        assert gerador.proxima_senha("P", dia) == "P002"
+        gerador.preparar(["P"], dia)
+
+    assert reservado_ate(dia, "P") == 2
+
+
+def test_sem_blocos_em_memoria_nao_gera_senha():
+    assert GeradorSenhas().proxima_senha("P", date(2001, 3, 3), reservar=False) is None
+
+
+def test_processos_nunca_repetem_senha():
+    """
+    Dois geradores (como dois processos) recebem blocos distintos
+    """
+    dia = date(2001, 4, 1)
+    primeiro = GeradorSenhas(tamanho_bloco=3)
+    segundo = GeradorSenhas(tamanho_bloco=3)
+
+    senhas = []
+    for _ in range(5):
+        senhas.append(primeiro.proxima_senha("P", dia))
+        senhas.append(segundo.proxima_senha("P", dia))
+
+    assert len(set(senhas)) == len(senhas)
+
+
+def test_reinicio_descarta_restante_do_bloco():
+    dia = date(2001, 5, 1)
+    GeradorSenhas(tamanho_bloco=10).proxima_senha("N", dia)
+
+    # Após reiniciar, a numeração continua depois do bloco reservado
+    assert GeradorSenhas(tamanho_bloco=10).proxima_senha("N", dia) == "N011"